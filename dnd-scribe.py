@@ -1,7 +1,35 @@
-import streamlit as st
-import torch
-from faster_whisper import WhisperModel
+import gc
+import io
+import math
+import multiprocessing as mp
 import os
+import subprocess
+import wave
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import soundfile as sf
+    import soxr
+except ImportError:
+    sf = soxr = None
+
+# Size CPU inference to physical cores; hyperthread siblings contend for the same int8 units.
+# OMP_NUM_THREADS must be set before CTranslate2 is imported.
+PHYSICAL_CORES = (psutil.cpu_count(logical=False) if psutil else None) or os.cpu_count() or 1
+os.environ.setdefault("OMP_NUM_THREADS", str(PHYSICAL_CORES))
+
+import numpy as np
+import streamlit as st
+import ctranslate2
+from faster_whisper import WhisperModel, decode_audio, download_model
+from faster_whisper.vad import VadOptions, get_speech_timestamps
 import tempfile
 from datetime import datetime
 
@@ -43,42 +71,297 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Whisper expects 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Frames read per block on the soundfile/soxr decode path
+DECODE_BLOCK_FRAMES = 1 << 20
+
+# Split on 1 s pauses; a slightly lower speech threshold keeps quiet or overlapping table talk
+VAD_OPTIONS = VadOptions(
+    threshold=0.45,
+    min_silence_duration_ms=1000,
+    speech_pad_ms=400
+)
+
+# Parallel CPU transcription settings
+CHUNK_SECONDS = 600
+CHUNK_WORKER_THREADS = 2
+
+# GPU compute types with fp16/bf16 activations, the only ones CTranslate2's flash attention accepts
+FLASH_ATTENTION_COMPUTE_TYPES = {"float16", "bfloat16", "int8_float16", "int8_bfloat16"}
+
+# Lightweight segment rebuilt in the parent from the plain tuples worker processes send back
+TranscriptSegment = namedtuple("TranscriptSegment", ["start", "end", "text"])
+
+# Per-process model used by chunk workers
+_chunk_model = None
+
+# Formatted timestamps keyed by whole second; a 6-hour session needs at most 21,600 entries
+_timestamp_cache = {}
+
+def resolve_model_path(model_size, model_cache_dir=None):
+    """Find the converted model in the cache dir, downloading it there only if it is missing"""
+    try:
+        # Skip the Hugging Face Hub round-trip when the model is already on disk
+        return download_model(model_size, local_files_only=True, cache_dir=model_cache_dir)
+    except Exception:
+        # Not cached yet (the "not found locally" error type varies across huggingface_hub versions)
+        return download_model(model_size, cache_dir=model_cache_dir)
+
+@st.cache_resource(show_spinner=False)
+def load_whisper(model_size, device, compute_type, cpu_threads=0, model_cache_dir=None):
+    """Load a Whisper model once per (size, device, compute type, threads) and reuse it across reruns"""
+    model_path = resolve_model_path(model_size, model_cache_dir)
+    
+    # Flash attention kernels need Ampere or newer (also where CTranslate2 enables bfloat16)
+    # and fp16/bf16 activations; they fail mid-transcription otherwise, past any load-time fallback
+    if (device == "cuda" and compute_type in FLASH_ATTENTION_COMPUTE_TYPES
+            and "bfloat16" in get_cuda_compute_types()):
+        try:
+            return WhisperModel(
+                model_path,
+                device=device,
+                device_index=0,
+                compute_type=compute_type,
+                flash_attention=True
+            )
+        except (ValueError, RuntimeError, TypeError):
+            # CTranslate2 build without flash kernels (or too old to accept the option)
+            pass
+    
+    return WhisperModel(
+        model_path, 
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=1
+    )
+
+def release_whisper_models():
+    """Drop cached Whisper models and return their memory to the system"""
+    load_whisper.clear()
+    gc.collect()
+
+def load_audio(uploaded_file):
+    """Decode an upload to 16 kHz mono float32 samples, using soundfile + soxr when they can read it"""
+    if sf is not None and soxr is not None:
+        uploaded_file.seek(0)
+        try:
+            with sf.SoundFile(uploaded_file) as f:
+                resampler = None
+                if f.samplerate != SAMPLE_RATE:
+                    resampler = soxr.ResampleStream(f.samplerate, SAMPLE_RATE, 1, dtype="float32", quality="HQ")
+                
+                # Downmix then resample block by block so a long 48 kHz stereo file is never fully in memory
+                pieces = []
+                for block in f.blocks(blocksize=DECODE_BLOCK_FRAMES, dtype="float32", always_2d=True):
+                    mono = block.mean(axis=1)
+                    pieces.append(resampler.resample_chunk(mono) if resampler else mono)
+                if resampler:
+                    pieces.append(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+                return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+        except RuntimeError:
+            # Format libsndfile can't read (e.g. M4A); fall back to PyAV below
+            pass
+    
+    uploaded_file.seek(0)
+    return decode_audio(uploaded_file, sampling_rate=SAMPLE_RATE)
+
+def find_chunk_cuts(audio, chunk_s=CHUNK_SECONDS):
+    """Pick cut points (in samples) near every chunk_s mark, placed in the middle of a pause"""
+    speech = get_speech_timestamps(audio, VAD_OPTIONS)
+    pauses = [(before["end"] + after["start"]) // 2 for before, after in zip(speech, speech[1:])]
+    
+    chunk_samples = chunk_s * SAMPLE_RATE
+    cuts = []
+    for index in range(1, math.ceil(len(audio) / chunk_samples)):
+        target = index * chunk_samples
+        previous = cuts[-1] if cuts else 0
+        candidates = [p for p in pauses if p > previous and abs(p - target) <= chunk_samples // 2]
+        
+        # Only ten minutes of unbroken speech leaves no pause to cut in
+        cut = min(candidates, key=lambda p: abs(p - target)) if candidates else target
+        if cut > previous:
+            cuts.append(cut)
+    return cuts
+
+def split_audio(audio, chunk_s=CHUNK_SECONDS):
+    """Split 16 kHz audio at pauses into roughly chunk_s long pieces, returning (offset, samples) pairs"""
+    bounds = [0] + find_chunk_cuts(audio, chunk_s) + [len(audio)]
+    return [(start / SAMPLE_RATE, audio[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+def _init_chunk_worker(model_path, cpu_threads):
+    """Load a private CPU model once in each chunk worker process"""
+    global _chunk_model
+    _chunk_model = WhisperModel(
+        model_path,
+        device="cpu",
+        compute_type="int8",
+        cpu_threads=cpu_threads
+    )
+
+def _transcribe_chunk(chunk_audio, offset, transcribe_kwargs):
+    """Transcribe one chunk and return its segments shifted to session time as (start, end, text) tuples"""
+    segments, _ = _chunk_model.transcribe(chunk_audio, **transcribe_kwargs)
+    # Plain tuples only: under `streamlit run` a class defined in this script can't be unpickled in the parent
+    return [(s.start + offset, s.end + offset, s.text) for s in segments]
+
+def transcribe_in_chunks(audio, model_size, model_cache_dir, transcribe_kwargs, max_workers):
+    """Transcribe long audio on CPU by fanning chunks cut at pauses out to worker processes"""
+    chunks = split_audio(audio)
+    
+    # Resolve (and if needed download) the model once here so workers don't race to fetch it
+    model_path = resolve_model_path(model_size, model_cache_dir)
+    
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_chunk_worker,
+        initargs=(model_path, CHUNK_WORKER_THREADS)
+    )
+    try:
+        futures = [
+            executor.submit(_transcribe_chunk, chunk_audio, offset, transcribe_kwargs)
+            for offset, chunk_audio in chunks
+        ]
+        
+        # Chunks are consumed in order, so segments come out sorted by start time
+        for future in futures:
+            for start, end, text in future.result():
+                yield TranscriptSegment(start, end, text)
+    finally:
+        # Don't leave queued chunks running if the transcript write is aborted
+        executor.shutdown(cancel_futures=True)
+
+def write_wav(path, audio):
+    """Write 16 kHz mono float samples to a 16-bit WAV file block by block"""
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        for start in range(0, len(audio), DECODE_BLOCK_FRAMES):
+            block = np.clip(audio[start:start + DECODE_BLOCK_FRAMES], -1.0, 1.0)
+            wav.writeframes((block * 32767).astype("<i2").tobytes())
+
+def _isolated_worker(model_args, cpu_model_args, audio_path, transcribe_kwargs, result_queue):
+    """Load a model and transcribe in a throwaway process, reporting (ok, segments or error message, fallback notice)"""
+    try:
+        fallback_notice = None
+        try:
+            model = load_whisper(*model_args)
+        except Exception as e:
+            if model_args == cpu_model_args:
+                raise
+            # Fallback to CPU if specified device fails, same as the in-process path
+            fallback_notice = f"Device loading failed: {str(e)}. Transcribed on CPU instead."
+            model = load_whisper(*cpu_model_args)
+        
+        segments, _ = model.transcribe(audio_path, **transcribe_kwargs)
+        # Plain tuples only: under `streamlit run` a class defined in this script can't be unpickled in the parent
+        result_queue.put((True, [(s.start, s.end, s.text) for s in segments], fallback_notice))
+    except Exception as e:
+        result_queue.put((False, str(e), None))
+
+def transcribe_isolated(model_args, cpu_model_args, audio, transcribe_kwargs):
+    """Transcribe in a separate process so any memory faster_whisper leaks is reclaimed when it exits"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Hand the audio over as a file rather than pickling the whole array into the child's arguments
+        audio_path = os.path.join(temp_dir, "audio.wav")
+        write_wav(audio_path, audio)
+        
+        ctx = mp.get_context("spawn")
+        result_queue = ctx.Queue()
+        process = ctx.Process(
+            target=_isolated_worker,
+            args=(model_args, cpu_model_args, audio_path, transcribe_kwargs, result_queue)
+        )
+        process.start()
+        
+        # Read before joining: the worker can't exit until its result has been drained from the pipe
+        try:
+            while True:
+                try:
+                    ok, payload, fallback_notice = result_queue.get(timeout=1)
+                    break
+                except Empty:
+                    if not process.is_alive() and result_queue.empty():
+                        raise RuntimeError(f"Transcription process exited unexpectedly (exit code {process.exitcode})")
+        finally:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+    
+    if not ok:
+        raise RuntimeError(payload)
+    return [TranscriptSegment(start, end, text) for start, end, text in payload], fallback_notice
+
 def format_timestamp(seconds):
     """Convert seconds to HH:MM:SS format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    key = int(seconds)
+    timestamp = _timestamp_cache.get(key)
+    if timestamp is None:
+        minutes, secs = divmod(key, 60)
+        hours, minutes = divmod(minutes, 60)
+        timestamp = _timestamp_cache[key] = f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return timestamp
 
-def create_dnd_transcript(segments):
-    """Create a clean D&D-style transcript without speaker diarization"""
-    transcript_lines = []
-    
+def transcript_header_lines():
+    """Yield the header lines of a D&D transcript"""
+    yield "D&D SESSION TRANSCRIPTION\n"
+    yield "=" * 50 + "\n"
+    yield f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    yield "\n"
+
+def format_transcript_entry(segment):
+    """Format a single segment as a timestamped transcript entry"""
+    return f"[{format_timestamp(segment.start)}]\n{segment.text.strip()}\n\n"
+
+def iter_transcript_lines(segments):
+    """Yield a clean D&D-style transcript line by line without speaker diarization"""
     # Add header
-    transcript_lines.append("D&D SESSION TRANSCRIPTION")
-    transcript_lines.append("=" * 50)
-    transcript_lines.append(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    transcript_lines.append("")
+    yield from transcript_header_lines()
     
+    # Add timestamp and text content, one segment at a time
     for segment in segments:
-        # Add timestamp
-        timestamp = format_timestamp(segment.start)
-        transcript_lines.append(f"[{timestamp}]")
-        
-        # Add text content
-        text = segment.text.strip()
-        transcript_lines.append(text)
-        transcript_lines.append("")
+        yield format_transcript_entry(segment)
+
+def create_dnd_transcript(segments, out=None):
+    """Create a clean D&D-style transcript, writing it to out as it goes or returning it if out is None"""
+    buf = out if out is not None else io.StringIO()
+    for line in iter_transcript_lines(segments):
+        buf.write(line)
+    
+    if out is None:
+        return buf.getvalue()
+
+def track_progress(segments, duration, progress_bar):
+    """Pass segments through while advancing the progress bar by audio position"""
+    segment_count = 0
+    last_percent = 0
+    for segment in segments:
+        segment_count += 1
+        percent = min(int(segment.end / duration * 100), 100) if duration else 100
+        if percent != last_percent:
+            progress_bar.progress(
+                percent,
+                text=f"Transcribing audio... {format_timestamp(segment.end)} / {format_timestamp(duration)}"
+            )
+            last_percent = percent
+        yield segment
     
-    return "\n".join(transcript_lines)
+    progress_bar.progress(100, text=f"Transcription complete! Segments processed: {segment_count}")
 
-def get_model_size():
+def get_model_size(cuda_available):
     """Recommend model size based on your use case"""
     st.markdown("### Model Selection")
     st.info("For D&D sessions (multi-hour), medium-large models work well.")
     st.info("Larger models = better accuracy but slower processing")
+    st.info("On CPU, Small (int8) is several times faster and far lighter on RAM than the large models "
+            "(about a sixth of their parameters), at the cost of noticeably more transcription errors on noisy table talk.")
     
     model_options = {
+        "Small (fastest CPU)": "small",
         "Medium": "medium",
         "Large-v2": "large-v2", 
         "Large-v3": "large-v3"
@@ -87,8 +370,8 @@ def get_model_size():
     selected_model = st.radio(
         "Choose model size:",
         options=list(model_options.keys()),
-        index=1,  # Default to large-v2
-        help="Medium for balance, Large-v2/Large-v3 for better accuracy"
+        index=2 if cuda_available else 0,  # Default to large-v2 on GPU, small on CPU
+        help="Small for fast CPU runs, Medium for balance, Large-v2/Large-v3 for better accuracy"
     )
     
     return model_options[selected_model]
@@ -122,10 +405,59 @@ def setup_device_selection(cuda_available):
     
     return device
 
+def get_gpu_compute_type():
+    """Let the user pick the GPU precision, defaulting to int8 weights with bf16 (Ampere+) or fp16 activations"""
+    compute_options = {}
+    
+    # bfloat16 keeps fp32's exponent range, so loud transients can't overflow the attention softmax
+    if "bfloat16" in get_cuda_compute_types():
+        compute_options["INT8 weights / BF16 activations"] = "int8_bfloat16"
+        compute_options["BF16"] = "bfloat16"
+    
+    compute_options.update({
+        "INT8 weights / FP16 activations": "int8_float16",
+        "FP16": "float16",
+        "INT8": "int8"
+    })
+    
+    selected_compute = st.sidebar.radio(
+        "GPU precision:",
+        options=list(compute_options.keys()),
+        index=0,  # Default to int8_bfloat16 where supported, int8_float16 otherwise
+        help="INT8 weights halve weight memory with negligible accuracy loss; BF16 needs an Ampere or newer GPU, FP16 works on older cards"
+    )
+    
+    return compute_options[selected_compute]
+
+@st.cache_data(show_spinner=False)
+def get_cuda_compute_types():
+    """List the compute types CTranslate2 supports on the GPU, or none if there is no usable GPU"""
+    try:
+        return set(ctranslate2.get_supported_compute_types("cuda"))
+    except (RuntimeError, ValueError):
+        # GPU picked manually without a working CUDA device; loading falls back to CPU later
+        return set()
+
+@st.cache_data(show_spinner=False)
+def get_gpu_name():
+    """Look up the name of the first GPU through nvidia-smi"""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+            check=True
+        )
+        return result.stdout.splitlines()[0].strip()
+    except (OSError, subprocess.SubprocessError, IndexError):
+        return "unknown NVIDIA GPU"
+
 def check_cuda_availability():
     """Check if CUDA is available and provide helpful messages"""
-    if torch.cuda.is_available():
-        st.success(f"✅ CUDA is available. Using GPU: {torch.cuda.get_device_name(0)}")
+    # Ask CTranslate2 directly instead of paying for a torch import
+    if ctranslate2.get_cuda_device_count() > 0:
+        st.success(f"✅ CUDA is available. Using GPU: {get_gpu_name()}")
         return True
     else:
         st.warning("⚠️ CUDA is not available. Will use CPU (slower but functional)")
@@ -137,25 +469,15 @@ def check_cuda_availability():
         """)
         return False
 
-def download_transcript_to_downloads(transcript_content, filename):
-    """Download transcript to user's downloads folder"""
-    try:
-        # Get user's downloads directory
-        import os
-        downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-        
-        # Create full file path
-        file_path = os.path.join(downloads_dir, filename)
-        
-        # Write the transcript to the downloads folder
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(transcript_content)
-        
-        st.success(f"✅ Transcript saved to: {file_path}")
-        return True
-    except Exception as e:
-        st.error(f"❌ Failed to save transcript to downloads: {str(e)}")
-        return False
+def get_transcript_path(filename):
+    """Pick where to stream the transcript, preferring the user's downloads folder"""
+    # Get user's downloads directory
+    downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+    if os.path.isdir(downloads_dir) and os.access(downloads_dir, os.W_OK):
+        return os.path.join(downloads_dir, filename)
+    
+    st.warning("⚠️ Could not write to your Downloads folder. Saving transcript to a temporary folder instead; use the download button below.")
+    return os.path.join(tempfile.gettempdir(), filename)
 
 def main():
     st.title("🧙‍♂️ D&D Session Transcriber")
@@ -168,11 +490,61 @@ def main():
     cuda_available = check_cuda_availability()
     
     # Model selection
-    model_size = get_model_size()
+    model_size = get_model_size(cuda_available)
     
     # Device selection
     device = setup_device_selection(cuda_available)
     
+    # GPU precision selection
+    gpu_compute_type = get_gpu_compute_type() if device == "cuda" else None
+    
+    # CPU thread tuning
+    cpu_threads = st.sidebar.slider(
+        "CPU threads",
+        1,
+        PHYSICAL_CORES * 2,
+        PHYSICAL_CORES,
+        help="Defaults to the number of physical cores; going above it rarely helps"
+    )
+    
+    # Decoding settings
+    beam_size = st.sidebar.slider(
+        "Beam size (accuracy vs speed)",
+        1,
+        5,
+        1,
+        help="1 is greedy decoding with temperature fallback, several times faster; 5 is the most accurate"
+    )
+    
+    # Model storage
+    model_cache_dir = st.sidebar.text_input(
+        "Model cache folder",
+        value=os.environ.get("WHISPER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "whisper")),
+        help="Where downloaded models are kept; point it at a fast SSD that isn't routinely cleaned out"
+    ).strip()
+    model_cache_dir = os.path.abspath(os.path.expanduser(model_cache_dir)) if model_cache_dir else None
+    
+    # Model memory management
+    keep_model_loaded = st.sidebar.checkbox(
+        "Keep model loaded between runs",
+        value=True,
+        help="Uncheck on small GPUs to free VRAM after every transcription (the model reloads next run)"
+    )
+    if st.sidebar.button("Unload model"):
+        release_whisper_models()
+        st.sidebar.success("✅ Model unloaded")
+    parallel_cpu = st.sidebar.checkbox(
+        "Parallel CPU transcription for long sessions",
+        value=True,
+        help="Splits sessions over 10 minutes at pauses and transcribes the pieces in parallel; "
+             "every worker loads its own copy of the model, so RAM use grows with the CPU thread count"
+    )
+    isolate_transcription = st.sidebar.checkbox(
+        "Run transcription in a separate process",
+        value=False,
+        help="Keeps this app's memory flat across many files if it grows run after run; the model reloads every run"
+    )
+    
     # File upload
     st.markdown("### Upload Audio File")
     uploaded_file = st.file_uploader(
@@ -184,7 +556,7 @@ def main():
     # Initialize session state for transcript
     if 'transcript_generated' not in st.session_state:
         st.session_state.transcript_generated = False
-        st.session_state.transcript_content = ""
+        st.session_state.transcript_path = ""
         st.session_state.transcript_filename = ""
     
     if uploaded_file is not None:
@@ -195,95 +567,112 @@ def main():
         # Process button
         if st.button("🚀 Transcribe Session", type="primary"):
             with st.spinner("Processing audio file... This may take several minutes."):
+                model = None
+                partial_path = None
                 try:
-                    # Create temporary file
-                    temp_dir = tempfile.mkdtemp()
-                    temp_file_path = os.path.join(temp_dir, "temp_audio.wav")
-                    
-                    # Save uploaded file
-                    with open(temp_file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    # Load model with proper device handling
-                    st.info("Loading Whisper model...")
+                    # Decode the upload in-process to 16 kHz mono samples, skipping the temp file round-trip
+                    audio = load_audio(uploaded_file)
+                    duration = len(audio) / SAMPLE_RATE
                     
-                    # Determine compute type based on device
-                    if device == "cuda":
-                        compute_type = "float16"
-                    else:
-                        compute_type = "int8"
+                    transcribe_kwargs = {
+                        "beam_size": beam_size,
+                        "temperature": [0.0, 0.2, 0.4],  # Retry hotter only when a segment fails the checks below
+                        "compression_ratio_threshold": 2.4,
+                        "word_timestamps": False,  # Transcript only uses segment start times
+                        "condition_on_previous_text": False,
+                        "vad_filter": True,  # Voice activity detection
+                        "vad_parameters": VAD_OPTIONS
+                    }
                     
-                    # Try to load model with specified device
-                    try:
-                        model = WhisperModel(
-                            model_size, 
-                            device=device,
-                            compute_type=compute_type
+                    # Long sessions on CPU are split into chunks and transcribed in parallel processes
+                    chunk_workers = cpu_threads // CHUNK_WORKER_THREADS
+                    if parallel_cpu and device == "cpu" and chunk_workers > 1 and duration > CHUNK_SECONDS:
+                        st.info(f"Transcribing in parallel across {chunk_workers} CPU workers...")
+                        segments = transcribe_in_chunks(
+                            audio,
+                            model_size,
+                            model_cache_dir,
+                            transcribe_kwargs,
+                            chunk_workers
                         )
+                    else:
+                        # Determine compute type based on device
+                        if device == "cuda":
+                            compute_type = gpu_compute_type
+                        else:
+                            compute_type = "int8"
+                        model_args = (model_size, device, compute_type, cpu_threads if device == "cpu" else 0, model_cache_dir)
+                        cpu_model_args = (model_size, "cpu", "int8", cpu_threads, model_cache_dir)
                         
-                        st.success("✅ Model loaded successfully!")
-                        
-                    except Exception as e:
-                        st.warning(f"⚠️ Device loading failed: {str(e)}")
-                        # Fallback to CPU if specified device fails
-                        st.info("Falling back to CPU processing...")
-                        model = WhisperModel(
-                            model_size, 
-                            device="cpu",
-                            compute_type="int8"
-                        )
-                        st.success("✅ Model loaded on CPU!")
-                    
-                    # Transcribe with timestamps
-                    st.info("Transcribing audio...")
-                    segments, info = model.transcribe(
-                        temp_file_path,
-                        beam_size=5,
-                        word_timestamps=True,
-                        condition_on_previous_text=False,
-                        vad_filter=True  # Voice activity detection
-                    )
+                        if isolate_transcription:
+                            st.info("Transcribing in a separate process...")
+                            segments, fallback_notice = transcribe_isolated(model_args, cpu_model_args, audio, transcribe_kwargs)
+                            if fallback_notice:
+                                st.warning(f"⚠️ {fallback_notice}")
+                        else:
+                            # Load model with proper device handling
+                            st.info("Loading Whisper model...")
+                            
+                            # Try to load model with specified device
+                            try:
+                                model = load_whisper(*model_args)
+                                
+                                st.success("✅ Model loaded successfully!")
+                                
+                            except Exception as e:
+                                st.warning(f"⚠️ Device loading failed: {str(e)}")
+                                # Fallback to CPU if specified device fails
+                                st.info("Falling back to CPU processing...")
+                                model = load_whisper(*cpu_model_args)
+                                st.success("✅ Model loaded on CPU!")
+                            
+                            # Transcribe with timestamps
+                            segments, _ = model.transcribe(audio, **transcribe_kwargs)
                     
-                    # Convert segments to list for processing
-                    segment_list = list(segments)
+                    # Stream segments to a .part file as they are decoded; it only takes the real name once complete
+                    transcript_filename = f"dnd_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+                    transcript_path = get_transcript_path(transcript_filename)
+                    partial_path = transcript_path + ".part"
+                    progress_bar = st.progress(0, text="Transcribing audio...")
+                    with open(partial_path, "w", encoding="utf-8") as f:
+                        create_dnd_transcript(track_progress(segments, duration, progress_bar), out=f)
+                    os.replace(partial_path, transcript_path)
                     
-                    # Create formatted transcript
                     st.success("Transcription complete!")
-                    formatted_transcript = create_dnd_transcript(segment_list)
                     
                     # Store in session state
-                    st.session_state.transcript_content = formatted_transcript
-                    st.session_state.transcript_filename = f"dnd_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+                    st.session_state.transcript_path = transcript_path
+                    st.session_state.transcript_filename = transcript_filename
                     st.session_state.transcript_generated = True
                     
                     # Show model info
-                    st.info(f"Segments processed: {len(segment_list)}")
-                    st.info(f"Total time: {format_timestamp(info.duration)}")
-                    
-                    # Automatically download to downloads folder
-                    with st.spinner("Saving transcript to your downloads folder..."):
-                        success = download_transcript_to_downloads(
-                            formatted_transcript, 
-                            st.session_state.transcript_filename
-                        )
-                        if success:
-                            st.success("✅ Transcript automatically saved to your Downloads folder!")
-                        else:
-                            st.warning("⚠️ Could not save to downloads folder. Please use the download button below.")
+                    st.info(f"Total time: {format_timestamp(duration)}")
+                    st.success(f"✅ Transcript saved to: {transcript_path}")
                     
                 except Exception as e:
+                    # Don't leave a truncated transcript behind
+                    if partial_path is not None and os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    
                     st.error(f"Error during transcription: {str(e)}")
                     st.info("Make sure your audio file is not corrupted and try again.")
                     st.info("If the error persists, try using a smaller model size or check CUDA installation.")
                 
                 finally:
-                    # Clean up temporary files
-                    try:
-                        if os.path.exists(temp_file_path):
-                            os.unlink(temp_file_path)
-                        os.rmdir(temp_dir)  # This will fail if directory isn't empty, but that's okay
-                    except:
-                        pass
+                    # Free model memory when it should not persist between runs
+                    if not keep_model_loaded:
+                        del model
+                        release_whisper_models()
+    
+    # Offer the saved transcript for download, served from the file on disk
+    if st.session_state.transcript_generated and os.path.exists(st.session_state.transcript_path):
+        with open(st.session_state.transcript_path, "rb") as fh:
+            st.download_button(
+                "📥 Download Transcript",
+                data=fh,
+                file_name=st.session_state.transcript_filename,
+                mime="text/plain"
+            )
 
 if __name__ == "__main__":
     main()